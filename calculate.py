@@ -3,40 +3,74 @@
 import argparse
 import json
 from os import mkdir, path
-from typing import Dict, List
+import os
+from typing import Dict, List, Tuple
 from datetime import datetime
 from shutil import copy
 from rasterio.coords import BoundingBox
 import numpy as np
-from copy import deepcopy
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
+from multiprocessing import Pool
 import rasterio
 import csv
+from collections import namedtuple
+from pyproj import Transformer
 
 from src.model.reference import Reference
 from src.database import Database
 from src.geo import Map
 from src.basins import Basin
-from src.geo import Coordinate, distance
+from src.geo import Coordinate, distances
 from src.activity import ActivityMap
 from src.measurement import Measurement, SoilActivity
 from src.model.common import pasquill_gifford_classes
 from src.model.input import Input
-from src.model.model import Model
+from src.model.model import Model, max_distance, per_class_results
 from plot import make_plots
 from utils import find_basins, parse_input
 from src.database import Database
 
 _reference = None
 _start = datetime.now()
+# start time doesn't change, so the report directory name is formatted once
+_report_dir_basename = f"report_{_start.strftime('%d-%m-%Y_%H-%M-%S')}"
 _output_directory = TemporaryDirectory()
 _output_directory_name = _output_directory.name
 _model_input = dict()
-
-
-def sum_dicts(rhs, lhs):
-    assert sorted(rhs.keys()) == sorted(lhs.keys())
-    return {key: rhs[key] + lhs[key] for key in rhs}
+_jobs = None
+_distance_nodes = None
+_worker_dose_contexts = None
+_worker_model = None
+# doses are calculated in double precision, but single one is enough to
+# store and plot the map
+_map_dtype = np.float32
+
+# doses bundle keys prefixes of model.per_class_results, in the same order
+_bundle_channels = (
+    "e_total_10_acute",
+    "e_total_10_period",
+    "e_inh",
+    "e_surface",
+    "e_cloud",
+    "e_food",
+    "concentration_integrals",
+    "depositions",
+    "depletions",
+)
+
+
+def jobs_count(value: str) -> int:
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError("at least 1 job is needed")
+    return count
+
+
+def distance_nodes_count(value: str) -> int:
+    count = int(value)
+    if count < 2:
+        raise argparse.ArgumentTypeError("at least 2 distances are needed")
+    return count
 
 
 def init_parser(parser: argparse.ArgumentParser) -> None:
@@ -46,6 +80,21 @@ def init_parser(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "-o", "--output", help="make report and put to directory"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=jobs_count,
+        help="number of worker processes for doses map, defaults to number "
+        "of CPUs available to the process",
+    )
+    parser.add_argument(
+        "--distance-nodes",
+        type=distance_nodes_count,
+        metavar="N",
+        help="approximate the model by interpolation between results at "
+        "given number of distances, model is evaluated for every activity "
+        "map cell by default",
+    )
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -58,10 +107,8 @@ def parse_arguments() -> argparse.Namespace:
 
 
 def report_dir_name() -> str:
-    global _start
-    report_dir_name = f"report_{_start.strftime('%d-%m-%Y_%H-%M-%S')}"
     global _output_directory_name
-    return path.join(_output_directory_name, report_dir_name)
+    return path.join(_output_directory_name, _report_dir_basename)
 
 
 def report_bin_dir_name() -> str:
@@ -113,10 +160,10 @@ def save_act_maps(maps: List[ActivityMap]) -> None:
         raster_filename = path.join(
             report_bin_dir_name(), f"{mp.nuclide}_actmap.tif"
         )
-        profile = mp.img.profile
-        data = mp.img.read(1)
-        with rasterio.open(raster_filename, "w", **profile) as f:
-            f.write(data, 1)
+        # the raster is copied block by block, so no full band copy is made
+        with rasterio.open(raster_filename, "w", **mp.img.profile) as f:
+            for _, window in mp.img.block_windows(1):
+                f.write(mp.img.read(1, window=window), 1, window=window)
 
     with open(
         path.join(report_bin_dir_name(), "raster_factors.json"), "w"
@@ -124,11 +171,28 @@ def save_act_maps(maps: List[ActivityMap]) -> None:
         json.dump(raster_factors, f)
 
 
-def dict_of_atm_class_arrays(x_len: int, y_len: int) -> dict:
-    d = dict()
-    for a_class in pasquill_gifford_classes:
-        d[a_class] = np.zeros((y_len, x_len))
-    return d
+def channels_array(y_len: int, x_len: int) -> np.ndarray:
+    # the maps are backed by an anonymous temporary file, so only the pages
+    # being written are kept in memory rather than all the maps at once
+    return np.memmap(
+        TemporaryFile(),
+        dtype=_map_dtype,
+        mode="w+",
+        shape=(
+            len(per_class_results),
+            len(pasquill_gifford_classes),
+            y_len,
+            x_len,
+        ),
+    )
+
+
+def bundle_view(channels: np.ndarray) -> dict:
+    return {
+        name: arr
+        for prefix, channel in zip(_bundle_channels, channels)
+        for name, arr in zip(list_of_atm_classes_names(prefix), channel)
+    }
 
 
 def list_of_atm_classes_names(prefix: str) -> list:
@@ -138,14 +202,22 @@ def list_of_atm_classes_names(prefix: str) -> list:
     return lst
 
 
-def dict_of_atm_class_to_list(d: Dict[str, float]) -> List[float]:
-    lst = list()
-    for a_class in pasquill_gifford_classes:
-        lst.append(d[a_class])
-    return lst
+# everything doses calculation needs but the point they are calculated in
+DoseContext = namedtuple(
+    "DoseContext",
+    [
+        "nuclide",
+        "specific_activities",
+        "lons",
+        "lats",
+        "nonzero_count",
+        "inp",
+        "table",
+    ],
+)
 
 
-def calculate_dose(actmap: ActivityMap, point: Coordinate) -> float:
+def make_model_input() -> Input:
     inp = Input()
     global _model_input
     inp.square_side = _model_input["square_side"]
@@ -162,186 +234,179 @@ def calculate_dose(actmap: ActivityMap, point: Coordinate) -> float:
     for afi_data in _model_input["annual_food_intake"]:
         afi[afi_data["food_category"]] = afi_data["intake"]
     inp.adults_annual_food_intake = afi
+    return inp
 
-    soil_density = _model_input["soil_density"]
 
-    global _reference
-    model = Model(_reference)
+def prepare_dose_context(actmap: ActivityMap) -> DoseContext:
+    inp = make_model_input()
+    square_area = inp.square_side * inp.square_side
+    contaminated_volume = actmap.contamination_depth / 100 * square_area
+    soil_density = _model_input["soil_density"]
 
     activities = actmap.img.read(1) / actmap.raster_factor
-    square_area = pow(inp.square_side, 2)
-
-    e_max_10_acute = 0
-    e_total_10_acute = dict.fromkeys(pasquill_gifford_classes, 0)
-    e_max_10_period = 0
-    e_total_10_period = dict.fromkeys(pasquill_gifford_classes, 0)
-    e_inh = dict.fromkeys(pasquill_gifford_classes, 0)
-    e_surface = dict.fromkeys(pasquill_gifford_classes, 0)
-    e_cloud = dict.fromkeys(pasquill_gifford_classes, 0)
-    e_food = dict.fromkeys(pasquill_gifford_classes, 0)
-    concentration_integrals = dict.fromkeys(pasquill_gifford_classes, 0)
-    depositions = dict.fromkeys(pasquill_gifford_classes, 0)
-    depletions = dict.fromkeys(pasquill_gifford_classes, 0)
-
-    for i in range(actmap.img.width):
-        for j in range(actmap.img.height):
-
-            activity = activities[j][i]
-            if activity == 0:
-                continue
-
-            xy = actmap.img.xy(j, i)
-
-            full_inp = deepcopy(inp)
-            full_inp.distance = distance(
-                point, Coordinate(lon=xy[0], lat=xy[1])
-            )
+    lons, lats = actmap.cells_centers()
+    # activity is zero almost everywhere but the shorelines, so only
+    # contaminated cells are kept
+    contaminated = np.nonzero(activities)
+    # cells centers are transformed to geographic coordinates once, so
+    # distances() doesn't transform them for every point
+    transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326")
+    lats, lons = transformer.transform(
+        xx=lons[contaminated], yy=lats[contaminated]
+    )
+    table = None
+    if _distance_nodes is not None:
+        # nodes span the distances the model accepts, but the farthest half
+        # of the square side, where dilution integrand gets out of range of
+        # dispersion coefficients
+        nodes = np.geomspace(
+            np.nextafter(inp.square_side / 2, np.inf),
+            max_distance - inp.square_side / 2,
+            _distance_nodes,
+        )
+        table = Model(_reference).tabulate(inp, actmap.nuclide, nodes)
+    return DoseContext(
+        nuclide=actmap.nuclide,
+        specific_activities=activities[contaminated]
+        * (1.0 / (contaminated_volume * soil_density)),
+        lons=lons,
+        lats=lats,
+        nonzero_count=len(contaminated[0]),
+        inp=inp,
+        table=table,
+    )
 
-            contaminated_volume = (
-                actmap.contamination_depth / 100 * square_area
-            )
-            specific_activity = activity / (contaminated_volume * soil_density)
 
-            nuclide = actmap.nuclide
-            full_inp.add_specific_activity(
-                nuclide=nuclide, specific_activity=specific_activity
-            )
+def accumulate_doses(
+    ctx: DoseContext, model: Model, cells_distances: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    # the model rejects cells beyond its maximum distance and within the half
+    # of the square side, so they are left out in advance
+    nearby = (cells_distances > ctx.inp.square_side / 2) & (
+        cells_distances <= max_distance
+    )
+    if not nearby.any():
+        return np.zeros(2), np.zeros(
+            (len(per_class_results), len(pasquill_gifford_classes))
+        )
+    if ctx.table is not None:
+        return ctx.table.calculate_batch_sum(
+            cells_distances[nearby], ctx.specific_activities[nearby]
+        )
+    return model.calculate_batch_sum(
+        ctx.inp,
+        ctx.nuclide,
+        cells_distances[nearby],
+        ctx.specific_activities[nearby],
+    )
 
-            if model.calculate(full_inp):
-                results = model.results
-                e_max_10_acute += results.e_max_10_acute
-                e_max_10_period += results.e_max_10_period
 
-                e_total_10_acute = sum_dicts(
-                    results.e_total_10_acute[nuclide], e_total_10_acute
-                )
-                e_total_10_period = sum_dicts(
-                    results.e_total_10_period[nuclide], e_total_10_period
-                )
-                e_inh = sum_dicts(results.e_inhalation[nuclide], e_inh)
-                e_surface = sum_dicts(results.e_surface[nuclide], e_surface)
-                e_cloud = sum_dicts(results.e_cloud[nuclide], e_cloud)
-                e_food = sum_dicts(results.e_food[nuclide], e_food)
-                concentration_integrals = sum_dicts(
-                    results.concentration_integrals[nuclide],
-                    concentration_integrals,
-                )
-                depositions = sum_dicts(
-                    results.depositions[nuclide], depositions
-                )
-                depletions = sum_dicts(
-                    results.full_depletions[nuclide], depletions
-                )
+def calculate_dose(
+    ctx: DoseContext, model: Model, point: Coordinate
+) -> Tuple[np.ndarray, np.ndarray]:
+    cells_distances = distances(point, ctx.lons, ctx.lats, crs="EPSG:4326")
+
+    e_max, channels = accumulate_doses(ctx, model, cells_distances)
+    channels[-1] /= ctx.nonzero_count
+    return e_max, channels
 
-    for a_class in depletions:
-        depletions[a_class] = depletions[a_class] / np.count_nonzero(
-            activities
-        )
 
-    return (
-        e_max_10_acute,  # 0
-        e_total_10_acute,  # 1
-        e_max_10_period,  # 2
-        e_total_10_period,  # 3
-        e_inh,  # 4
-        e_surface,  # 5
-        e_cloud,  # 6
-        e_food,  # 7
-        concentration_integrals,  # 8
-        depositions,  # 9
-        depletions,  # 10
+def init_dose_worker(
+    contexts: List[DoseContext], reference: Reference
+) -> None:
+    global _worker_dose_contexts
+    _worker_dose_contexts = contexts
+    # model can't be pickled, so every worker makes its own
+    global _worker_model
+    _worker_model = Model(reference)
+
+
+def calculate_worker_dose(task: Tuple[int, Coordinate]) -> Tuple:
+    context_index, point = task
+    return calculate_dose(
+        _worker_dose_contexts[context_index], _worker_model, point
     )
 
 
+def available_cpus() -> int:
+    # the process may be restricted to a subset of CPUs, e.g. in a container
+    # or a batch job, and os.cpu_count() doesn't take it into account
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
 def make_bin_data_name(nuclide_name: str, value_name: str) -> path:
     return path.join(report_bin_dir_name(), (nuclide_name + "_" + value_name))
 
 
-def calculate_doses_map(activity_maps: List[ActivityMap], inp: Dict) -> None:
+def calculate_doses_map(contexts: List[DoseContext], inp: Dict) -> None:
     res = inp["resolution"]
     x = np.linspace(start=inp["ul"]["lon"], stop=inp["lr"]["lon"], num=res)
     y = np.linspace(start=inp["ul"]["lat"], stop=inp["lr"]["lat"], num=res)
 
-    with open(path.join(report_bin_dir_name(), "coords.npy"), "wb") as f:
-        np.savez(f, x=x, y=y)
-
-    e_max_10_acute = np.zeros((len(y), len(x)))
-    e_max_10_period = np.zeros((len(y), len(x)))
-    e_total_10_acute = dict_of_atm_class_arrays(len(y), len(x))
-    e_total_10_period = dict_of_atm_class_arrays(len(y), len(x))
-    e_inh = dict_of_atm_class_arrays(len(y), len(x))
-    e_surface = dict_of_atm_class_arrays(len(y), len(x))
-    e_cloud = dict_of_atm_class_arrays(len(y), len(x))
-    e_food = dict_of_atm_class_arrays(len(y), len(x))
-    concentration_integrals = dict_of_atm_class_arrays(len(y), len(x))
-    depositions = dict_of_atm_class_arrays(len(y), len(x))
-    depletions = dict_of_atm_class_arrays(len(y), len(x))
-
-    for act_map in activity_maps:
-        nuclide = act_map.nuclide
-        for j in range(len(x)):
-            for i in range(len(y)):
-                coo = Coordinate(lon=x[j], lat=y[i])
-                results = calculate_dose(act_map, coo)
-                e_max_10_acute[i][j] = results[0]
-                e_max_10_period[i][j] = results[2]
-                for a_class in pasquill_gifford_classes:
-                    e_total_10_acute[a_class][i][j] = results[1][a_class]
-                    e_total_10_period[a_class][i][j] = results[3][a_class]
-                    e_inh[a_class][i][j] = results[4][a_class]
-                    e_surface[a_class][i][j] = results[5][a_class]
-                    e_cloud[a_class][i][j] = results[6][a_class]
-                    e_food[a_class][i][j] = results[7][a_class]
-                    concentration_integrals[a_class][i][j] = results[8][
-                        a_class
-                    ]
-                    depositions[a_class][i][j] = results[9][a_class]
-                    depletions[a_class][i][j] = results[10][a_class]
-                print(
-                    f"ts: {datetime.now().strftime('%H:%M:%S')};"
-                    f" j = {j}/{len(x)}; i = {i}/{len(y)}; coo: {coo}; "
-                    f"nuclide: {nuclide}; acute dose: "
-                    f"{e_max_10_acute[i][j]:.2e} "
-                    f"Sv; period dose: {e_max_10_period[i][j]:.2e}"
-                )
-
-        with open(
-            make_bin_data_name(nuclide, "e_max_10_acute.npy"), "wb"
-        ) as f:
-            np.save(f, e_max_10_acute)
-        with open(
-            make_bin_data_name(nuclide, "e_max_10_period.npy"), "wb"
-        ) as f:
-            np.save(f, e_max_10_period)
-        with open(
-            make_bin_data_name(nuclide, "e_total_10_acute.npz"), "wb"
-        ) as f:
-            np.savez(f, **e_total_10_acute)
-        with open(
-            make_bin_data_name(nuclide, "e_total_10_period.npz"), "wb"
-        ) as f:
-            np.savez(f, **e_total_10_period)
-        with open(make_bin_data_name(nuclide, "e_inh.npz"), "wb") as f:
-            np.savez(f, **e_inh)
-        with open(make_bin_data_name(nuclide, "e_surface.npz"), "wb") as f:
-            np.savez(f, **e_surface)
-        with open(make_bin_data_name(nuclide, "e_cloud.npz"), "wb") as f:
-            np.savez(f, **e_cloud)
-        with open(make_bin_data_name(nuclide, "e_food.npz"), "wb") as f:
-            np.savez(f, **e_food)
-        with open(
-            make_bin_data_name(nuclide, "concentration_integrals.npz"),
-            "wb",
-        ) as f:
-            np.savez(f, **concentration_integrals)
-        with open(make_bin_data_name(nuclide, "depositions.npz"), "wb") as f:
-            np.savez(f, **depositions)
-        with open(make_bin_data_name(nuclide, "depletions.npz"), "wb") as f:
-            np.savez(f, **depletions)
+    with open(path.join(report_bin_dir_name(), "coords.npz"), "wb") as f:
+        np.savez_compressed(f, x=x, y=y)
+
+    # acute and period maximum doses
+    e_max = np.zeros((2, len(y), len(x)), dtype=_map_dtype)
+    channels = channels_array(len(y), len(x))
+
+    # map points go row by row, the maps memory layout order
+    indices = [(i, j) for i in range(len(y)) for j in range(len(x))]
+    lons, lats = (grid.ravel() for grid in np.meshgrid(x, y))
+    # points are transformed to geographic coordinates all at once, so
+    # distances() doesn't have to transform them one by one
+    transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326")
+    lats, lons = transformer.transform(xx=lons, yy=lats)
+    points = [
+        Coordinate(lon=lon, lat=lat, crs="EPSG:4326")
+        for lon, lat in zip(lons, lats)
+    ]
+
+    # map points of all the activity maps are independent, so they are
+    # calculated by a single pool of worker processes each holding its own
+    # copy of the dose contexts; the maps follow each other in the tasks
+    # queue, so the workers don't idle while a map is being finished
+    tasks = (
+        (context_index, point)
+        for context_index in range(len(contexts))
+        for point in points
+    )
+    with Pool(
+        processes=_jobs,
+        initializer=init_dose_worker,
+        initargs=(contexts, _reference),
+    ) as pool:
+        doses = pool.imap(calculate_worker_dose, tasks)
+        for ctx in contexts:
+            nuclide = ctx.nuclide
+            # results come in order, zip() stops taking them after the last
+            # point of the map
+            for (i, j), (point_e_max, point_channels) in zip(indices, doses):
+                e_max[:, i, j] = point_e_max
+                channels[:, :, i, j] = point_channels
+                # points go row by row, report once a row is done
+                if j == len(x) - 1:
+                    print(
+                        f"ts: {datetime.now().strftime('%H:%M:%S')};"
+                        f" i = {i + 1}/{len(y)}; nuclide: {nuclide}; "
+                        "max acute dose: "
+                        f"{e_max[0, i].max():.2e} Sv; "
+                        "max period dose: "
+                        f"{e_max[1, i].max():.2e} Sv"
+                    )
+
+            np.savez_compressed(
+                make_bin_data_name(nuclide, "doses.npz"),
+                e_max_10_acute=e_max[0],
+                e_max_10_period=e_max[1],
+                **bundle_view(channels),
+            )
 
 
 def calculate_doses_in_special_points(
-    activity_maps: List[ActivityMap], inp: List
+    contexts: List[DoseContext], inp: List
 ) -> None:
     f = open(path.join(report_dir_name(), "special_points.csv"), "w")
     writer = csv.writer(
@@ -379,34 +444,24 @@ def calculate_doses_in_special_points(
         ]
     )
 
+    model = Model(_reference)
     for point_data in inp:
         coo = Coordinate(lon=point_data["lon"], lat=point_data["lat"])
         row = point_data["name"]
-        for act_map in activity_maps:
-            results = calculate_dose(act_map, coo)
-            e_max_10_acute = results[0]
-            e_max_10_period = results[2]
+        for ctx in contexts:
+            e_max, channels = calculate_dose(ctx, model, coo)
             row += (
-                f"; {act_map.nuclide}: acute {e_max_10_acute:.2e};"
-                f" period {e_max_10_period:.2e}"
+                f"; {ctx.nuclide}: acute {e_max[0]:.2e};"
+                f" period {e_max[1]:.2e}"
             )
             writer.writerow(
                 [
                     point_data["name"],
                     point_data["lon"],
                     point_data["lat"],
-                    act_map.nuclide,
-                    e_max_10_acute,
-                    e_max_10_period,
-                    *dict_of_atm_class_to_list(results[1]),
-                    *dict_of_atm_class_to_list(results[3]),
-                    *dict_of_atm_class_to_list(results[4]),
-                    *dict_of_atm_class_to_list(results[5]),
-                    *dict_of_atm_class_to_list(results[6]),
-                    *dict_of_atm_class_to_list(results[7]),
-                    *dict_of_atm_class_to_list(results[8]),
-                    *dict_of_atm_class_to_list(results[9]),
-                    *dict_of_atm_class_to_list(results[10]),
+                    ctx.nuclide,
+                    *e_max,
+                    *channels.ravel(),
                 ]
             )
         print(row)
@@ -419,6 +474,8 @@ if __name__ == "__main__":
     inp = parse_input(args.input)
     _model_input = inp["model"]
     _reference = Reference(Database(inp["database_name"]))
+    _jobs = args.jobs if args.jobs is not None else available_cpus()
+    _distance_nodes = args.distance_nodes
     save_plots = False
     if args.output is not None:
         _output_directory_name = args.output
@@ -431,10 +488,10 @@ if __name__ == "__main__":
         basins, inp["basins"], raster.img.bounds, inp["model"]["square_side"]
     )
     save_act_maps(activity_maps)
+    # doses map and special points share the dose contexts
+    contexts = [prepare_dose_context(act_map) for act_map in activity_maps]
     if "map" in inp["points"]:
-        calculate_doses_map(activity_maps, inp["points"]["map"])
+        calculate_doses_map(contexts, inp["points"]["map"])
     if "special" in inp["points"]:
-        calculate_doses_in_special_points(
-            activity_maps, inp["points"]["special"]
-        )
+        calculate_doses_in_special_points(contexts, inp["points"]["special"])
     make_plots(report_dir_name(), save_plots, basins)
@@ -5,10 +5,10 @@ from utils import find_basins, parse_input
 from src.geo import Map
 
 import argparse
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
 import json
-import re
-from os import walk, path
+from os import scandir, path
 from os.path import isfile
 import rasterio
 from matplotlib import pyplot as plt
@@ -18,7 +18,6 @@ from matplotlib.colors import LogNorm
 import matplotlib.patches as patches
 import numpy as np
 from math import log10, floor
-import math
 import scipy.ndimage
 import locale
 
@@ -27,7 +26,19 @@ _bin_dir_name = None
 _save = True
 _quiet = False
 _basins = None
+# basins contours in km, the same for every figure
+_basins_contours = None
 _special_points = None
+# special points coordinates in km, the same for every figure
+_special_points_xy = None
+_figure_size = (8, 8)
+_figure_dpi = 150
+_figure_resolution = _figure_size[0] * _figure_dpi
+_compass_filename = path.join("data", "compass.png")
+_act_map_cmap = plt.get_cmap("YlGn")
+# base close to 1 gives about ten log-spaced levels over any doses range,
+# the locator is stateless, so all the contours figures share it
+_contours_locator = ticker.LogLocator(base=1.00001)
 
 
 def _log(msg: str) -> None:
@@ -39,16 +50,22 @@ def find_exp(number) -> int:
     return floor(base10)
 
 
+@lru_cache(maxsize=1)
+def load_compass_image() -> Optional[np.ndarray]:
+    if not isfile(_compass_filename):
+        return None
+    return image.imread(_compass_filename)
+
+
 def add_compass_image(fig, ax) -> None:
-    compass_filename = path.join("data", "compass.png")
-    if not isfile(compass_filename):
-        _log(f"{compass_filename} is missing")
+    im = load_compass_image()
+    if im is None:
+        _log(f"{_compass_filename} is missing")
         return
     fig_size = fig.get_size_inches() * fig.dpi
     ax_pos = ax.get_position()
     x_min = ax_pos.bounds[0] * fig_size[0]
     y_max = (ax_pos.bounds[1] + ax_pos.bounds[3]) * fig_size[1]
-    im = image.imread(compass_filename)
     im_width, im_height, _ = im.shape
     fig.figimage(
         im, xo=x_min + im_width * 0.1, yo=y_max - im_height * 1.1, alpha=1
@@ -66,6 +83,17 @@ def add_axes_labels(ax) -> None:
     ax.set_ylabel("Y, км")
 
 
+def find_bin_files(suffix: str) -> List[str]:
+    files = sorted(
+        entry.name
+        for entry in scandir(_bin_dir_name)
+        if entry.is_file() and entry.name.endswith(suffix)
+    )
+    if not files:
+        _log(f"no files matching '*{suffix}'")
+    return files
+
+
 def plot_act_maps() -> None:
     raster_factors_filename = path.join(_bin_dir_name, "raster_factors.json")
     if not isfile(raster_factors_filename):
@@ -75,60 +103,57 @@ def plot_act_maps() -> None:
     with open(raster_factors_filename, "r") as f:
         raster_factors = json.load(f)
 
-    regex = re.compile(".*_actmap.tif")
-    for _root, _dirs, files in walk(_bin_dir_name):
-        found = False
-        for file in files:
-            if regex.match(file):
-                found = True
-                nuclide = file.split("_")[0]
-                with rasterio.open(
-                    path.join(_bin_dir_name, file), "r"
-                ) as dataset:
-                    bounds = dataset.bounds
-                    _x_0, dist_x = make_centralized_coords(
-                        [bounds[0], bounds[2]], 2
-                    )
-                    _y_0, dist_y = make_centralized_coords(
-                        [bounds[1], bounds[3]], 2
-                    )
-                    extent = [dist_x[0], dist_x[1], dist_y[0], dist_y[1]]
-                    data = dataset.read(1) / raster_factors[nuclide]
-                    fig = new_figure()
-                    ax = plt.subplot()
-                    shw = ax.imshow(
-                        data,
-                        cmap=plt.get_cmap("YlGn"),
-                        norm=LogNorm(vmin=1e7, vmax=data.max()),
-                        extent=extent,
-                    )
-                    plt.colorbar(shw, fraction=0.046, pad=0.04)
-                    ax.title.set_text(f"Активность {nuclide}, Бк")
-                    add_axes_labels(ax)
-                    add_grid(ax)
-                    add_compass_image(fig, ax)
-
-                    global _save
-                    if _save:
-                        plt.savefig(
-                            path.join(
-                                _bin_dir_name, "..", f"{nuclide}_actmap.png"
-                            )
-                        )
-                    global _quiet
-                    if not _quiet:
-                        plt.show()
-        if not found:
-            _log(f"no files matching '{regex.pattern}'")
+    for file in find_bin_files("_actmap.tif"):
+        nuclide = file.split("_")[0]
+        with rasterio.open(path.join(_bin_dir_name, file), "r") as dataset:
+            bounds = dataset.bounds
+            _x_0, dist_x = make_centralized_coords([bounds[0], bounds[2]], 2)
+            _y_0, dist_y = make_centralized_coords([bounds[1], bounds[3]], 2)
+            extent = [dist_x[0], dist_x[1], dist_y[0], dist_y[1]]
+            data = dataset.read(1)
+            # there is no point in drawing more pixels than the figure has;
+            # activity is only on thin shorelines, so every block of cells is
+            # drawn with its peak cell, an average would blur them out
+            step = max(1, max(data.shape) // _figure_resolution)
+            if step > 1:
+                height, width = (size // step for size in data.shape)
+                data = (
+                    data[: height * step, : width * step]
+                    .reshape(height, step, width, step)
+                    .max(axis=(1, 3))
+                )
+            data = data / raster_factors[nuclide]
+            fig = new_figure()
+            ax = plt.subplot()
+            shw = ax.imshow(
+                data,
+                cmap=_act_map_cmap,
+                norm=LogNorm(vmin=1e7, vmax=data.max()),
+                extent=extent,
+            )
+            plt.colorbar(shw, fraction=0.046, pad=0.04)
+            ax.title.set_text(f"Активность {nuclide}, Бк")
+            add_axes_labels(ax)
+            add_grid(ax)
+            add_compass_image(fig, ax)
+
+            global _save
+            if _save:
+                plt.savefig(
+                    path.join(_bin_dir_name, "..", f"{nuclide}_actmap.png")
+                )
+            global _quiet
+            if not _quiet:
+                plt.show()
+            plt.close(fig)
 
 
 def add_special_points(ax, x_0: float, y_0: float) -> None:
     global _special_points
     if _special_points is not None:
-        for point in _special_points:
-            x = point["lon"] / 1000 - x_0
-            y = point["lat"] / 1000 - y_0
-            ax.scatter(x, y, c="red")
+        xy = _special_points_xy - (x_0, y_0)
+        ax.scatter(xy[:, 0], xy[:, 1], c="red")
+        for point, (x, y) in zip(_special_points, xy):
             ax.annotate(
                 point["name"],
                 (x, y),
@@ -138,18 +163,17 @@ def add_special_points(ax, x_0: float, y_0: float) -> None:
 
 
 def new_figure():
-    return plt.figure(figsize=(8, 8), dpi=150)
+    return plt.figure(figsize=_figure_size, dpi=_figure_dpi)
 
 
 def add_basins(ax, x_0: float, y_0: float, label=False) -> None:
     global _basins
+    global _basins_contours
     for basin_name in _basins:
         basin = _basins[basin_name]
-        array = np.transpose(np.array(basin.body.exterior.xy))
-        for row in array:
-            row[0] = row[0] / 1000 - x_0
-            row[1] = row[1] / 1000 - y_0
-        patch = patches.Polygon(xy=array, closed=True)
+        patch = patches.Polygon(
+            xy=_basins_contours[basin_name] - (x_0, y_0), closed=True
+        )
         ax.add_patch(patch)
         if label:
             center = basin.body.centroid.coords[0]
@@ -180,6 +204,7 @@ def plot_basins(raster: Map):
     global _quiet
     if not _quiet:
         plt.show()
+    plt.close(fig)
 
 
 def make_centralized_coords(
@@ -198,14 +223,15 @@ def make_centralized_coords(
 def plot_doses_map_heatmap(
     x: List[float], y: List[float], doses: Dict[str, np.ndarray]
 ) -> None:
+    # only the edges are needed for the extent
+    x_0, dist_x = make_centralized_coords(x, 2)
+    y_0, dist_y = make_centralized_coords(y, 2)
+    extent = [dist_x.min(), dist_x.max(), dist_y.min(), dist_y.max()]
     for target in doses:
         fig = new_figure()
         ax = plt.subplot()
         data = doses[target]
 
-        x_0, dist_x = make_centralized_coords(x, data.shape[0])
-        y_0, dist_y = make_centralized_coords(y, data.shape[1])
-        extent = [dist_x.min(), dist_x.max(), dist_y.min(), dist_y.max()]
         cb = plt.imshow(
             data, extent=extent, vmin=np.min(data), vmax=np.max(data)
         )
@@ -228,24 +254,36 @@ def plot_doses_map_heatmap(
         global _quiet
         if not _quiet:
             plt.show()
+        plt.close(fig)
+
+
+def contours_zoom(shape: Tuple[int, int]) -> int:
+    # doses map is upsampled to get smooth contours, but there is no point
+    # in getting more points than the figure has pixels
+    return max(1, min(50, _figure_resolution // max(shape)))
 
 
 def plot_doses_map_contours(
     x: List[float], y: List[float], doses: Dict[str, np.ndarray]
 ) -> None:
+    # all the maps have the same shape, so do the upsampled ones
+    zoom = contours_zoom((len(y), len(x)))
+    x_0, dist_x = make_centralized_coords(x, len(x) * zoom)
+    y_0, dist_y = make_centralized_coords(y, len(y) * zoom)
     count = 0
     for target in doses:
+        data = doses[target]
+        if not data.any():
+            _log(f"{target} doses map is all zeros, skipping its contours")
+            continue
         fig = new_figure()
         ax = plt.subplot()
         count += 1
-        data = doses[target]
         exponent = find_exp(data.max())
+        data = scipy.ndimage.zoom(data, zoom)
         if exponent < 0:
-            data = data * math.pow(10, -exponent)
-
-        data = scipy.ndimage.zoom(data, 50)
-        x_0, dist_x = make_centralized_coords(x, data.shape[0])
-        y_0, dist_y = make_centralized_coords(y, data.shape[1])
+            # zoom has already made a new array, it can be scaled in place
+            data *= 10.0**-exponent
         if target == "sum":
             name = f"Суммарная эффективная доза, 1E{exponent} Зв"
         else:
@@ -255,7 +293,7 @@ def plot_doses_map_contours(
             dist_x,
             dist_y,
             data,
-            locator=ticker.LogLocator(base=1.00001),
+            locator=_contours_locator,
             # levels=10,
             corner_mask=False,
         )
@@ -274,33 +312,26 @@ def plot_doses_map_contours(
         global _quiet
         if not _quiet:
             plt.show()
+        plt.close(fig)
 
 
 def plot_doses_maps() -> None:
-    coords_filename = path.join(_bin_dir_name, "coords.npy")
+    coords_filename = path.join(_bin_dir_name, "coords.npz")
     if not isfile(coords_filename):
         _log(f"{coords_filename} is missing")
         return
 
-    with open(coords_filename, "rb") as f:
-        data = np.load(f)
-        x = data["x"]
-        y = data["y"]
+    with np.load(coords_filename) as coords:
+        x = coords["x"]
+        y = coords["y"]
 
     sum_doses = np.zeros((len(y), len(x)))
-    regex = re.compile(".*_e_max.npy")
     doses = dict()
-    for _root, _dirs, files in walk(_bin_dir_name):
-        found = False
-        for file in files:
-            if regex.match(file):
-                found = True
-                nuclide = file.split("_")[0]
-                with open(path.join(_bin_dir_name, file), "rb") as f:
-                    doses[nuclide] = np.load(f)
-                    sum_doses += doses[nuclide]
-        if not found:
-            _log(f"no files matching '{regex.pattern}'")
+    for file in find_bin_files("_doses.npz"):
+        nuclide = file.split("_")[0]
+        with np.load(path.join(_bin_dir_name, file)) as bundle:
+            doses[nuclide] = bundle["e_max_10_acute"]
+            sum_doses += doses[nuclide]
 
     doses["sum"] = sum_doses
 
@@ -330,6 +361,9 @@ def make_plots(
     _save = save
     global _quiet
     _quiet = quiet
+    if _quiet:
+        # figures are only saved, an interactive backend isn't needed
+        plt.switch_backend("Agg")
     inp = parse_input(path.join(report_dir_name, "input.json"))
     raster = Map(inp["geotiff_filename"])
     if basins is None:
@@ -337,8 +371,21 @@ def make_plots(
     if "special" in inp["points"]:
         global _special_points
         _special_points = inp["points"]["special"]
+        global _special_points_xy
+        _special_points_xy = (
+            np.array(
+                [[point["lon"], point["lat"]] for point in _special_points],
+                dtype=float,
+            ).reshape(-1, 2)
+            / 1000
+        )
     global _basins
     _basins = basins
+    global _basins_contours
+    _basins_contours = {
+        name: np.asarray(basin.body.exterior.coords) / 1000
+        for name, basin in basins.items()
+    }
     plot_basins(raster)
     plot_act_maps()
     plot_doses_maps()
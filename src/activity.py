@@ -3,8 +3,9 @@
 from .geo import Coordinate
 import math
 import numpy as np
-from rasterio import Affine, MemoryFile
-from shapely import geometry, ops
+from rasterio import Affine, MemoryFile, features
+from shapely import geometry, vectorized
+from shapely.prepared import prep
 
 
 def _log(msg):
@@ -96,35 +97,56 @@ class ActivityMap(object):
         if surface_activity == 0:
             return
 
-        data = self.img.read(1)
+        lefts, bottoms, rights, tops = self.__cells_bounds()
 
+        rows, cols, areas = [], [], []
         for shoreline_segment in basin.shoreline:
             shoreline_poly = shoreline_segment.buffer(
                 basin.shoreline_width / 2,
                 cap_style=geometry.CAP_STYLE.square,
                 join_style=geometry.JOIN_STYLE.mitre,
             )
-            for i in range(self.img.width):
-                for j in range(self.img.height):
-                    x, y = self.img.xy(i, j)
-                    cell_poly = self.__get_cell_poly(x, y)
+            # only cells touched by the shoreline may intersect it
+            candidates = np.argwhere(
+                features.rasterize(
+                    [(shoreline_poly, 1)],
+                    out_shape=lefts.shape,
+                    transform=self.img.transform,
+                    all_touched=True,
+                    dtype=np.uint8,
+                )
+            )
+            # prepared geometry answers predicates against shoreline faster
+            prepared_poly = prep(shoreline_poly)
+            for i, j in candidates:
+                cell_poly = geometry.box(
+                    lefts[i, j], bottoms[i, j], rights[i, j], tops[i, j]
+                )
+                if prepared_poly.contains(cell_poly):
+                    intersection = cell_poly.area
+                else:
                     intersection = shoreline_poly.intersection(cell_poly).area
-                    if intersection == 0:
-                        continue
+                if intersection == 0:
+                    continue
+                rows.append(i)
+                cols.append(j)
+                areas.append(intersection)
 
-                    activity = surface_activity * intersection
-                    raster_factor = self.__update_raster_factor(activity)
-                    if self.__raster_factor is None:
-                        self.__raster_factor = raster_factor
-                    elif raster_factor != self.__raster_factor:
-                        data = (
-                            data / self.__raster_factor * raster_factor
-                        ).astype(self.__type)
-                        self.__raster_factor = raster_factor
+        if not areas:
+            return
 
-                    data[i, j] += raster_factor * activity
+        activities = surface_activity * np.array(areas)
+        # raster factor is chosen the same way as if the cells were added one
+        # by one, but the raster is rescaled at most once
+        previous_raster_factor = self.__raster_factor
+        for activity in activities:
+            self.__raster_factor = self.__update_raster_factor(activity)
 
-        self.img.write(data, 1)
+        data = self.img.read(1).astype(np.float64)
+        if previous_raster_factor not in (None, self.__raster_factor):
+            data *= self.__raster_factor / previous_raster_factor
+        np.add.at(data, (rows, cols), self.__raster_factor * activities)
+        self.img.write(data.astype(self.__type), 1)
 
     def __init_img(self, ul, lr):
         ul.transform("EPSG:3857")
@@ -136,7 +158,7 @@ class ActivityMap(object):
         if x_res == 0 or y_res == 0:
             raise ExceedingStepError
 
-        data = np.zeros((x_res, y_res)).astype(self.__type)
+        data = np.zeros((y_res, x_res)).astype(self.__type)
 
         # lower bottom corner doesn't necessary consist with initial lower
         # bottom
@@ -159,28 +181,26 @@ class ActivityMap(object):
         )
         self.img.write(data, 1)
 
+    def cells_centers(self):
+        """Get coordinates of all the cells centers
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: x and y coordinates of the cells
+                centers, both arrays have the image shape
+        """
+        rows, cols = np.mgrid[0 : self.img.height, 0 : self.img.width]
+        return self.img.transform * (cols + 0.5, rows + 0.5)
+
     def __calculate_average_surface_activity(self, measurements):
-        average = 0
-        for measurement in measurements:
-            average += measurement.activity.surface_1cm
-        average *= self.contamination_depth
-        average /= len(measurements)
-        return average
-
-    def __get_cell_poly(self, x, y):
-        top = y + self.__step / 2
-        bottom = y - self.__step / 2
-        right = x - self.__step / 2
-        left = x + self.__step / 2
-        cell = geometry.Polygon(
-            [
-                [right, bottom],
-                [right, top],
-                [left, top],
-                [left, bottom],
-            ]
+        total = sum(
+            measurement.activity.surface_1cm for measurement in measurements
         )
-        return cell
+        return total * self.contamination_depth / len(measurements)
+
+    def __cells_bounds(self):
+        xs, ys = self.cells_centers()
+        half_step = self.__step / 2
+        return xs - half_step, ys - half_step, xs + half_step, ys + half_step
 
     def __update_raster_factor(self, activity):
         max_raster_code = np.iinfo(self.__type).max
@@ -197,29 +217,26 @@ class ActivityMap(object):
         return max_raster_code / (2 * activity)
 
     def __check_measurments(self, basin, measurements):
+        self.__check_measurments_location(measurements, basin)
         for measurement in measurements:
-            self.__check_measurment_location(measurement, basin)
             self.__check_measurment_proximity(measurement, basin)
 
-    def __check_measurment_location(self, measurement, basin):
-        coo = measurement.coo
-        if basin.body.contains(geometry.Point(coo.lon, coo.lat)):
+    def __check_measurments_location(self, measurements, basin):
+        lons = np.array([measurement.coo.lon for measurement in measurements])
+        lats = np.array([measurement.coo.lat for measurement in measurements])
+        # all the measurements are checked against basin in one call
+        if vectorized.contains(basin.body, lons, lats).any():
             raise InvalidMeasurementLocation
 
     def __check_measurment_proximity(self, measurement, basin):
-        proximate_enough = False
-        for shoreline_segment in basin.shoreline:
-            measurement_point = geometry.Point(
-                measurement.coo.lon, measurement.coo.lat
-            )
-            (coo1, coo2) = ops.nearest_points(
-                measurement_point, shoreline_segment
-            )
-            distance = coo1.distance(coo2)
-            proximate_enough = (
-                proximate_enough or distance <= self.__measurement_proximity
-            )
-        if proximate_enough is False:
+        measurement_point = geometry.Point(
+            measurement.coo.lon, measurement.coo.lat
+        )
+        if not any(
+            measurement_point.distance(shoreline_segment)
+            <= self.__measurement_proximity
+            for shoreline_segment in basin.shoreline
+        ):
             raise ExceedingMeasurementProximity
 
     @property
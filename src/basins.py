@@ -3,8 +3,8 @@
 import cv2 as cv
 from matplotlib import pyplot as plt
 from matplotlib.ticker import AutoMinorLocator
-from .geo import Coordinate
 from shapely import geometry
+from shapely.strtree import STRtree
 import numpy as np
 
 
@@ -98,7 +98,7 @@ class BasinsFinder(object):
 
     def __find_contours(self):
         pix_cnts, hierarchy = cv.findContours(
-            self.map.data, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_NONE
+            self.map.data, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE
         )
         _log(f"found {len(pix_cnts)} basins")
         return pix_cnts
@@ -114,16 +114,12 @@ class BasinsFinder(object):
             pix_cnt = cv.approxPolyDP(pix_cnt, self.__approx_error, True)
             if len(pix_cnt) < 3:
                 continue
-            coord_cnt = []
-            for pix_vertice in pix_cnt:
-                pix_vertice = pix_vertice[0]
-                coord_vertice = self.map.img.xy(
-                    pix_vertice[1], pix_vertice[0], offset="ul"
-                )
-                coord_vertice = Coordinate(
-                    coord_vertice[0], coord_vertice[1], self.map.img.crs
-                )
-                coord_cnt.append([coord_vertice.lon, coord_vertice.lat])
+            # upper left corners of the vertices pixels, all at once
+            xs, ys = self.map.img.transform * (
+                pix_cnt[:, 0, 0],
+                pix_cnt[:, 0, 1],
+            )
+            coord_cnt = np.column_stack((xs, ys)).tolist()
             try:
                 self.__basins.append(
                     Basin(
@@ -134,6 +130,12 @@ class BasinsFinder(object):
             except ValueError as e:
                 _log(f"{e}")
         _log(f"added {len(self.basins)} basins")
+        # bounding boxes index, so only a few basins are checked for
+        # containing a point
+        self.__basins_tree = STRtree(
+            [basin.body for basin in self.basins],
+            items=range(len(self.basins)),
+        )
 
     def __get_map_contour(self):
         left, top = self.map.img.xy(0, 0, offset="ul")
@@ -145,9 +147,9 @@ class BasinsFinder(object):
     def get_basin(self, coo):
         coo.transform(self.map.img.crs)
         point = geometry.Point(coo.lon, coo.lat)
-        for basin in self.basins:
-            if basin.body.contains(point):
-                return basin
+        for idx in sorted(self.__basins_tree.query_items(point)):
+            if self.basins[idx].body.contains(point):
+                return self.basins[idx]
         return None
 
     def plot(self):
@@ -5,25 +5,54 @@ import numpy as np
 import cv2 as cv
 from matplotlib import pyplot as plt
 from pyproj import Transformer, Geod
-from copy import deepcopy
+from copy import copy
+from functools import lru_cache
 
 
 def _log(msg):
     print("map: " + msg)
 
 
+# WGS84 ellipsoid shared by all the distances calculations
+_geod = Geod(ellps="WGS84")
+
+
+@lru_cache(maxsize=None)
+def _transformer(crs_from, crs_to):
+    # making a transformer is much slower than transforming a point with it,
+    # and only a few pairs of CRSs are ever used
+    return Transformer.from_crs(crs_from, crs_to)
+
+
 def distance(coo0, coo1):
-    coo0 = deepcopy(coo0)
+    coo0 = copy(coo0)
     coo0.transform("EPSG:4326")
-    coo1 = deepcopy(coo1)
+    coo1 = copy(coo1)
     coo1.transform("EPSG:4326")
-    geod = Geod(ellps="WGS84")
-    return geod.line_length([coo0.lon, coo1.lon], [coo0.lat, coo1.lat])
+    return _geod.line_length([coo0.lon, coo1.lon], [coo0.lat, coo1.lat])
+
+
+def distances(coo, lons, lats, crs="EPSG:3857"):
+    """Vectorized distance() from a single coordinate to arrays of points
+    given in crs"""
+    coo = copy(coo)
+    coo.transform("EPSG:4326")
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if crs != "EPSG:4326":
+        lats, lons = _transformer(crs, "EPSG:4326").transform(xx=lons, yy=lats)
+    _az12, _az21, dist = _geod.inv(
+        np.full(lons.shape, coo.lon), np.full(lats.shape, coo.lat), lons, lats
+    )
+    return dist
 
 
 class Coordinate(object):
     """Coordinate with datum switching"""
 
+    # a doses map makes a coordinate per point, no instance dict is needed
+    __slots__ = ("__lon", "__lat", "__crs")
+
     def __init__(self, lon, lat, crs="EPSG:3857"):
         self.__lon = lon
         self.__lat = lat
@@ -31,8 +60,7 @@ class Coordinate(object):
 
     def transform(self, crs):
         if crs != self.__crs:
-            transformer = Transformer.from_crs(self.__crs, crs)
-            self.__lat, self.__lon = transformer.transform(
+            self.__lat, self.__lon = _transformer(self.__crs, crs).transform(
                 yy=self.lat, xx=self.lon
             )
             self.__crs = crs
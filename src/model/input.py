@@ -34,6 +34,30 @@ class Input:
     def __str__(self):
         return str(self.__values)
 
+    def clone(self) -> "Input":
+        """Make a copy of the input, the values are already valid so they are
+        not validated again
+
+        Returns:
+            Input: copy of the input, specific activities are copied and
+                other values are shared with the original
+        """
+        clone = Input()
+        for key in self.__values:
+            if key != "specific_activities":
+                clone.__values[key] = (
+                    self.__values[key],
+                    lambda x: True,
+                    str(),
+                )
+        for nuclide in self.specific_activities:
+            clone.specific_activities[nuclide] = (
+                self.specific_activities[nuclide],
+                lambda x: True,
+                str(),
+            )
+        return clone
+
     def initialized(self) -> bool:
         """Check if all fields have values
 
@@ -32,9 +32,14 @@ from .formulas import (
 import math
 import numpy as np
 from ..activity import calculate_release_activity
+from functools import partial
 from typing import Tuple, Dict
 
 
+# maximum distance from the source the model is applicable within, m
+max_distance = 50000
+
+
 class DefaultConstraints(IConstraints):
 
     """Default input constraints class"""
@@ -47,9 +52,9 @@ class DefaultConstraints(IConstraints):
         """
         super(DefaultConstraints, self).__init__()
         self.add(
-            lambda inp: inp.distance <= 50000,
+            lambda inp: inp.distance <= max_distance,
             lambda inp: f"the distance '{inp.distance} m' exceeds the maximum "
-            "allowed '50000 m'",
+            f"allowed '{max_distance} m'",
         )
         self.add(
             lambda inp: inp.distance > (inp.square_side / 2),
@@ -69,6 +74,25 @@ class DefaultConstraints(IConstraints):
         )
 
 
+# Results attributes holding values per nuclide per atmospheric class
+per_class_results = (
+    "e_total_10_acute",
+    "e_total_10_period",
+    "e_inhalation",
+    "e_surface",
+    "e_cloud",
+    "e_food",
+    "concentration_integrals",
+    "depositions",
+    "full_depletions",
+)
+
+# results linear in specific activity, i.e. all but depletions
+_scaled_results = np.array(
+    [name != "full_depletions" for name in per_class_results]
+)
+
+
 class Results:
     def __init__(self, nuclides: Tuple[str] = tuple()):
         for nuclide in nuclides:
@@ -95,6 +119,112 @@ class Results:
     full_depletions = {}
 
 
+def _sum_unit_batch(
+    e_max: np.ndarray,
+    values: np.ndarray,
+    specific_activities: np.ndarray,
+    multiplicities: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Scale results of a batch for unit specific activity and sum them
+
+    Args:
+        e_max (np.ndarray): e_max_10_acute and e_max_10_period with shape
+            (N, 2)
+        values (np.ndarray): per_class_results values with shape
+            (N, len(per_class_results), len(pasquill_gifford_classes))
+        specific_activities (np.ndarray): specific activities the results are
+            scaled with, Bq/kg
+        multiplicities (np.ndarray): weights of the results not depending on
+            specific activity, i.e. depletions
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: sums of e_max with shape (2,) and sums
+            of values with shape
+            (len(per_class_results), len(pasquill_gifford_classes))
+    """
+    e_max_sum = specific_activities @ e_max
+    values_sum = np.einsum("n,nkc->kc", specific_activities, values)
+    unscaled = ~_scaled_results
+    values_sum[unscaled] = np.einsum(
+        "n,nkc->kc", multiplicities, values[:, unscaled]
+    )
+    return e_max_sum, values_sum
+
+
+class ResponseTable:
+    """Results of a single nuclide for unit specific activity tabulated over
+    distance
+
+    Results between the tabulated distances are interpolated linearly in
+    logarithm of distance and clamped to the edge values outside them. It's
+    an approximation of Model.calculate_batch_sum(), which evaluates the
+    model at each source distance.
+    """
+
+    def __init__(
+        self, distances: np.ndarray, e_max: np.ndarray, values: np.ndarray
+    ):
+        """ResponseTable constructor
+
+        Args:
+            distances (np.ndarray): ascending tabulated distances, m
+            e_max (np.ndarray): e_max_10_acute and e_max_10_period at the
+                distances with shape (N, 2)
+            values (np.ndarray): per_class_results values at the distances
+                with shape
+                (N, len(per_class_results), len(pasquill_gifford_classes))
+        """
+        self.__log_distances = np.log(distances)
+        self.__e_max = e_max
+        self.__values = values
+
+    def calculate_batch_sum(
+        self, distances: np.ndarray, specific_activities: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Interpolate results for a batch of sources and sum them over the
+        sources, see Model.calculate_batch_sum()
+
+        Interpolation is linear, so sources contributions are distributed
+        between the two nearest tabulated distances first and only these
+        are scaled and summed.
+
+        Args:
+            distances (np.ndarray): distances to the sources, m
+            specific_activities (np.ndarray): specific activities of the
+                sources, Bq/kg
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: sums of e_max_10_acute and
+                e_max_10_period with shape (2,) and sums of per_class_results
+                in the same order with shape
+                (len(per_class_results), len(pasquill_gifford_classes))
+        """
+        nodes = self.__log_distances
+        log_distances = np.log(distances)
+        lower = np.clip(
+            np.searchsorted(nodes, log_distances, side="right") - 1,
+            0,
+            len(nodes) - 2,
+        )
+        upper_weights = np.clip(
+            (log_distances - nodes[lower]) / (nodes[lower + 1] - nodes[lower]),
+            0,
+            1,
+        )
+
+        def distribute(weights: np.ndarray) -> np.ndarray:
+            return np.bincount(
+                lower, weights * (1 - upper_weights), len(nodes)
+            ) + np.bincount(lower + 1, weights * upper_weights, len(nodes))
+
+        return _sum_unit_batch(
+            self.__e_max,
+            self.__values,
+            distribute(specific_activities),
+            distribute(np.ones(len(distances))),
+        )
+
+
 class Model:
     """Doses & dilution factor calculator based on 2 scenario in Руководство
     по безопасности при использовании атомной энергии «Рекомендуемые методы
@@ -137,6 +267,127 @@ class Model:
         if not self.validate_input(inp):
             return False
 
+        self._set_levals(inp)
+        self._calculate_for_distance(inp.distance)
+        self._update_results(inp.nuclides, inp.distance)
+
+        return True
+
+    def calculate_batch_sum(
+        self,
+        inp: Input,
+        nuclide: str,
+        distances: np.ndarray,
+        specific_activities: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Execute calculations for a batch of sources of a single nuclide
+        differing in distance and specific activity only and sum the results
+        over the sources
+
+        Results are linear in specific activity (but depletions which don't
+        depend on it and are counted per source), so the model is evaluated
+        for unit specific activity and the values are scaled and summed in a
+        single pass. The evaluations which don't depend on distance, e.g.
+        x_max, are shared by all the sources.
+
+        Args:
+            inp (Input): input data with no specific activities, its distance
+                is ignored
+            nuclide (str): nuclide name
+            distances (np.ndarray): distances to the sources, m
+            specific_activities (np.ndarray): specific activities of the
+                sources, Bq/kg
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: sums of e_max_10_acute and
+                e_max_10_period with shape (2,) and sums of per_class_results
+                in the same order with shape
+                (len(per_class_results), len(pasquill_gifford_classes))
+
+        Raises:
+            ValueError: input has specific activities of other nuclides
+        """
+        e_max, values = self._calculate_unit_batch(inp, nuclide, distances)
+        return _sum_unit_batch(
+            e_max, values, specific_activities, np.ones(len(distances))
+        )
+
+    def tabulate(
+        self, inp: Input, nuclide: str, distances: np.ndarray
+    ) -> "ResponseTable":
+        """Tabulate results of a single nuclide for unit specific activity
+        over distance
+
+        Args:
+            inp (Input): input data with no specific activities, its distance
+                is ignored
+            nuclide (str): nuclide name
+            distances (np.ndarray): ascending distances to tabulate results
+                at, m
+
+        Returns:
+            ResponseTable: results table
+
+        Raises:
+            ValueError: input has specific activities of other nuclides
+        """
+        return ResponseTable(
+            distances, *self._calculate_unit_batch(inp, nuclide, distances)
+        )
+
+    def _calculate_unit_batch(
+        self, inp: Input, nuclide: str, distances: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Execute calculations for a batch of sources of a single nuclide
+        with unit specific activity
+
+        Args:
+            inp (Input): input data with no specific activities, its distance
+                is ignored
+            nuclide (str): nuclide name
+            distances (np.ndarray): distances to the sources, m
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: e_max_10_acute and e_max_10_period
+                with shape (N, 2) and per_class_results values with shape
+                (N, len(per_class_results), len(pasquill_gifford_classes));
+                sources failed input validation have zero results
+
+        Raises:
+            ValueError: input has specific activities of other nuclides
+        """
+        unit_inp = inp.clone()
+        unit_inp.add_specific_activity(nuclide, 1)
+        if unit_inp.nuclides != (nuclide,):
+            raise ValueError(
+                f"batch input should have no nuclides but '{nuclide}'"
+            )
+
+        size = len(distances)
+        e_max = np.zeros((size, 2))
+        values = np.zeros(
+            (size, len(per_class_results), len(pasquill_gifford_classes))
+        )
+
+        self._set_levals(unit_inp)
+        for k in range(size):
+            unit_inp.distance = distances[k]
+            if not self.validate_input(unit_inp):
+                continue
+            self._calculate_for_distance(distances[k])
+            e_max[k] = (
+                self._ed_acute.result((distances[k],)),
+                self._ed_for_period.result((distances[k],)),
+            )
+            values[k] = self._per_class_values(nuclide, distances[k])
+        return e_max, values
+
+    def _set_levals(self, inp: Input):
+        """Set all the lazy evaluations, none of them depends on distance
+
+        Args:
+            inp (Input): input data
+        """
         self._set_dispersion_coeffs()
         self._set_depletions(
             inp.extreme_windspeeds, inp.precipitation_rate, inp.terrain_type
@@ -147,7 +398,7 @@ class Model:
             inp.extreme_windspeeds, inp.square_side, inp.terrain_type
         )
         self._set_food_specific_activity_leval()
-        self._set_deposition_leval(inp.distance)
+        self._set_deposition_leval()
         self._set_concentration_integral_levals(
             inp.specific_activities,
             inp.extreme_windspeeds,
@@ -158,17 +409,52 @@ class Model:
             inp.nuclides, inp.buffer_area_radius, inp.square_side
         )
         self._set_effective_doses_exposure_sources_levals(
-            inp.age, inp.distance, inp.adults_annual_food_intake
+            inp.age, inp.adults_annual_food_intake
         )
         self._set_effective_doses_total_levals()
         self._set_effective_doses_levals(inp.nuclides)
 
-        self._ed_acute()
-        self._ed_for_period()
+    def _calculate_for_distance(self, distance: float):
+        """Evaluate the doses at distance
 
-        self._update_results(inp.nuclides)
+        Args:
+            distance (float): distance, m
+        """
+        self._ed_acute((distance,))
+        self._ed_for_period((distance,))
 
-        return True
+    def _per_class_values(self, nuclide: str, distance: float) -> np.ndarray:
+        """Get evaluated values per atmospheric class of a nuclide
+
+        Args:
+            nuclide (str): nuclide name
+            distance (float): distance doses were evaluated at, m
+
+        Returns:
+            np.ndarray: values of per_class_results in the same order, one
+                row per Results attribute and one column per atmospheric class
+        """
+        x_max = self._x_max.result()
+        levals = (
+            (self._ed_total_acute, distance),
+            (self._ed_total_period, distance),
+            (self._ed_inh, distance),
+            (self._ed_surf, distance),
+            (self._ed_cloud, distance),
+            (self._ed_food, x_max),
+            (self._ci, x_max),
+            (self._deposition, distance),
+            (self._depletion, x_max),
+        )
+        return np.array(
+            [
+                [
+                    leval.result((aclass, nuclide, x))
+                    for aclass in pasquill_gifford_classes
+                ]
+                for leval, x in levals
+            ]
+        )
 
     def validate_input(self, inp: Input) -> bool:
         """Validate input
@@ -188,57 +474,44 @@ class Model:
         log(f"invalid input: {inp}")
         return False
 
-    def _update_results(self, nuclides: Tuple[str]):
-        """Update results attribute"""
+    def _update_results(self, nuclides: Tuple[str], distance: float):
+        """Update results attribute
+
+        Args:
+            nuclides (Tuple[str]): all the nuclides for current calculation
+            distance (float): distance, m
+        """
         results = Results(nuclides)
-        results.e_max_10_acute = self._ed_acute.result()
-        results.e_max_10_period = self._ed_for_period.result()
-        x_max = self._x_max.result()
+        results.e_max_10_acute = self._ed_acute.result((distance,))
+        results.e_max_10_period = self._ed_for_period.result((distance,))
         for nuclide in nuclides:
-            for aclass in pasquill_gifford_classes:
-                results.e_total_10_acute[nuclide][
-                    aclass
-                ] = self._ed_total_acute.result((aclass, nuclide))
-                results.e_total_10_period[nuclide][
-                    aclass
-                ] = self._ed_total_period.result((aclass, nuclide))
-                results.e_inhalation[nuclide][aclass] = self._ed_inh.result(
-                    (aclass, nuclide)
-                )
-                results.e_surface[nuclide][aclass] = self._ed_surf.result(
-                    (aclass, nuclide)
-                )
-                results.e_cloud[nuclide][aclass] = self._ed_cloud.result(
-                    (aclass, nuclide)
-                )
-                results.e_food[nuclide][aclass] = self._ed_food.result(
-                    (aclass, nuclide, x_max)
+            values = self._per_class_values(nuclide, distance)
+            for name, row in zip(per_class_results, values.tolist()):
+                getattr(results, name)[nuclide] = dict(
+                    zip(pasquill_gifford_classes, row)
                 )
-                results.concentration_integrals[nuclide][
-                    aclass
-                ] = self._ci.result((aclass, nuclide, x_max))
-                results.depositions[nuclide][aclass] = self._deposition.result(
-                    (aclass, nuclide)
-                )
-                results.full_depletions[nuclide][
-                    aclass
-                ] = self._depletion.result((aclass, nuclide, x_max))
         self._results = results
 
     def _set_dispersion_coeffs(self):
-        """Set dispersion coefficients lazy evaluation"""
+        """Set dispersion coefficients lazy evaluation
+
+        The coefficients are integrated over distance, so every evaluation
+        has a new argument and there is nothing to cache; instead the functions
+        of distance with reference data bound are evaluated once per
+        atmospheric class
+        """
         self._sigma_z = LEval(
-            lambda aclass, x: dispersion_coeff_z(
+            lambda aclass: partial(
+                dispersion_coeff_z,
                 self._reference.diffusion_coefficients(aclass)["p_z"],
                 self._reference.diffusion_coefficients(aclass)["q_z"],
-                x,
             )
         )
         self._sigma_y = LEval(
-            lambda aclass, x: dispersion_coeff_y(
+            lambda aclass: partial(
+                dispersion_coeff_y,
                 self._reference.diffusion_coefficients(aclass)["p_y"],
                 self._reference.diffusion_coefficients(aclass)["q_y"],
-                x,
             )
         )
 
@@ -267,7 +540,7 @@ class Model:
             lambda aclass, nuclide, x: depletion_dry(
                 self._reference.deposition_rate(nuclide),
                 wind_speeds[aclass],
-                lambda xx: self._sigma_z((aclass, xx)),
+                self._sigma_z((aclass,)),
                 self._reference.terrain_roughness(terrain_type),
                 x,
             )
@@ -311,7 +584,7 @@ class Model:
                 self._depletion((aclass, nuclide, x)),
                 wind_speeds[aclass],
                 square_side / 2,
-                lambda xx: self._sigma_y((aclass, xx)),
+                self._sigma_y((aclass,)),
                 x,
             )
         )
@@ -326,7 +599,7 @@ class Model:
             lambda aclass, x: vertical_dispersion(
                 self._reference.mixing_layer_height,
                 self._reference.terrain_roughness(terrain_type),
-                self._sigma_z((aclass, x)),
+                self._sigma_z((aclass,))(x),
                 self._reference.terrain_roughness(terrain_type),
             )
         )
@@ -348,8 +621,8 @@ class Model:
         self._dilution = LEval(
             lambda aclass, nuclide, x: dilution_factor(
                 self._depletion((aclass, nuclide, x)),
-                lambda xx: self._sigma_y((aclass, xx)),
-                lambda xx: self._sigma_z((aclass, xx)),
+                self._sigma_y((aclass,)),
+                self._sigma_z((aclass,)),
                 wind_speeds[aclass],
                 lambda xx, z: self._vert_dispersion((aclass, xx)),
                 square_side / 2,
@@ -371,18 +644,14 @@ class Model:
             )
         )
 
-    def _set_deposition_leval(self, distance: float):
-        """Set deposition lazy evaluation
-
-        Args:
-            distance (float): distance
-        """
+    def _set_deposition_leval(self):
+        """Set deposition lazy evaluation"""
         self._deposition = LEval(
-            lambda aclass, nuclide: deposition(
+            lambda aclass, nuclide, x: deposition(
                 self._reference.deposition_rate(nuclide),
                 self._sediment_detachment_constant((nuclide,)),
-                self._ci((aclass, nuclide, distance)),
-                self._hdci((aclass, nuclide, distance)),
+                self._ci((aclass, nuclide, x)),
+                self._hdci((aclass, nuclide, x)),
             )
         )
 
@@ -440,7 +709,7 @@ class Model:
         """
         distances = np.logspace(
             math.log10(square_side / 2),
-            math.log10(50000 - square_side / 2),
+            math.log10(max_distance - square_side / 2),
             10,
         )
 
@@ -467,14 +736,12 @@ class Model:
     def _set_effective_doses_exposure_sources_levals(
         self,
         age: int,
-        distance: float,
         adults_annual_food_intake: Dict[str, float],
     ):
         """Set effective doses for all exposure sources lazy evaluations
 
         Args:
             age (int): population group age
-            distance (float): distance
             adults_annual_food_intake (Dict[str, float]): adults annual food
                 intake
         """
@@ -505,8 +772,8 @@ class Model:
             )
         )
         self._ed_inh = LEval(
-            lambda aclass, nuclide: effective_dose_inhalation(
-                self._ci((aclass, nuclide, distance)),
+            lambda aclass, nuclide, x: effective_dose_inhalation(
+                self._ci((aclass, nuclide, x)),
                 self._reference.inhalation_dose_coeff(nuclide),
                 self._reference.respiration_rate(age),
             )
@@ -519,15 +786,15 @@ class Model:
             )
         )
         self._ed_surf = LEval(
-            lambda aclass, nuclide: effective_dose_surface(
-                self._deposition((aclass, nuclide)),
+            lambda aclass, nuclide, x: effective_dose_surface(
+                self._deposition((aclass, nuclide, x)),
                 self._reference.surface_dose_coeff(nuclide),
                 self._residence_time_coeff((nuclide,)),
             )
         )
         self._ed_cloud = LEval(
-            lambda aclass, nuclide: effective_dose_cloud(
-                self._ci((aclass, nuclide, distance)),
+            lambda aclass, nuclide, x: effective_dose_cloud(
+                self._ci((aclass, nuclide, x)),
                 self._reference.cloud_dose_coeff(nuclide),
             )
         )
@@ -537,29 +804,23 @@ class Model:
         evaluations
         """
         self._ed_total_period = LEval(
-            lambda aclass, nuclide: total_effective_dose_for_period(
+            lambda aclass, nuclide, x: total_effective_dose_for_period(
                 1,
                 nuclide,
-                self._ed_cloud((aclass, nuclide)),
-                self._ed_inh((aclass, nuclide)),
-                self._ed_surf((aclass, nuclide)),
+                self._ed_cloud((aclass, nuclide, x)),
+                self._ed_inh((aclass, nuclide, x)),
+                self._ed_surf((aclass, nuclide, x)),
                 self._ed_food((aclass, nuclide, self._x_max())),
-                {
-                    nuclide: self._reference.nuclide_group(nuclide)
-                    for nuclide in self._reference.nuclides
-                },
+                self._reference.nuclides_groups,
             )
         )
         self._ed_total_acute = LEval(
-            lambda aclass, nuclide: acute_total_effective_dose(
+            lambda aclass, nuclide, x: acute_total_effective_dose(
                 nuclide,
-                self._ed_cloud((aclass, nuclide)),
-                self._ed_inh((aclass, nuclide)),
-                self._ed_surf((aclass, nuclide)),
-                {
-                    nuclide: self._reference.nuclide_group(nuclide)
-                    for nuclide in self._reference.nuclides
-                },
+                self._ed_cloud((aclass, nuclide, x)),
+                self._ed_inh((aclass, nuclide, x)),
+                self._ed_surf((aclass, nuclide, x)),
+                self._reference.nuclides_groups,
             )
         )
 
@@ -570,18 +831,24 @@ class Model:
             nuclides (Tuple[str]): all the nuclides for current calculation
         """
 
-        def make_ed_total_list(ed_total: LEval) -> Tuple[Dict[str, float]]:
+        def make_ed_total_list(
+            ed_total: LEval, x: float
+        ) -> Tuple[Dict[str, float]]:
             ed_total_results = list()
             for nuclide in nuclides:
                 nuclide_ed_total = dict()
                 for aclass in pasquill_gifford_classes:
-                    nuclide_ed_total[aclass] = ed_total((aclass, nuclide))
+                    nuclide_ed_total[aclass] = ed_total((aclass, nuclide, x))
                 ed_total_results.append(nuclide_ed_total)
             return ed_total_results
 
         self._ed_acute = LEval(
-            lambda: effective_dose(make_ed_total_list(self._ed_total_acute))
+            lambda x: effective_dose(
+                make_ed_total_list(self._ed_total_acute, x)
+            )
         )
         self._ed_for_period = LEval(
-            lambda: effective_dose(make_ed_total_list(self._ed_total_period))
+            lambda x: effective_dose(
+                make_ed_total_list(self._ed_total_period, x)
+            )
         )
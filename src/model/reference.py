@@ -24,6 +24,9 @@ class IReference:
         self._food = {}
         self._atmosphere_accum_factors = {}
         self._soil_accum_factors = {}
+        # values derived from the tables above, built on first access
+        self._nuclides_groups = None
+        self._age_groups_ids = {}
         self._initialize_data()
 
     def _initialize_data(self):
@@ -99,6 +102,20 @@ class IReference:
         """
         return tuple(self._nuclides.keys())
 
+    @property
+    def nuclides_groups(self) -> Dict[str, str]:
+        """Get groups of all nuclides known by reference data
+
+        Returns:
+            Dict[str, str]: nuclides groups by nuclides names
+        """
+        if self._nuclides_groups is None:
+            self._nuclides_groups = {
+                nuclide: self.nuclide_group(nuclide)
+                for nuclide in self.nuclides
+            }
+        return self._nuclides_groups
+
     def nuclide_decay_coeff(self, nuclide: str) -> float:
         """Get radioactivity decay coefficient
 
@@ -294,11 +311,14 @@ class IReference:
         Raises:
             ValueError: age fits no known age group
         """
+        if age in self._age_groups_ids:
+            return self._age_groups_ids[age]
         for group_id in self._age_groups:
             if (
                 age >= self._age_groups[group_id]["lower_age"]
                 and age < self._age_groups[group_id]["upper_age"]
             ):
+                self._age_groups_ids[age] = group_id
                 return group_id
         raise ValueError(f"invalid age '{age}'")
 
@@ -22,11 +22,11 @@ def check_empty_map(ul, lr, new_lr, step, ref_width, ref_height):
     assert actmap.height == ref_height
     assert actmap.index(ul.lon + step / 2, ul.lat - step / 2) == (0, 0)
     assert actmap.index(new_lr.lon - step / 2, new_lr.lat + step / 2) == (
-        actmap.width - 1,
         actmap.height - 1,
+        actmap.width - 1,
     )
     assert actmap.xy(0, 0) == (ul.lon + step / 2, ul.lat - step / 2)
-    assert actmap.xy(actmap.width - 1, actmap.height - 1) == (
+    assert actmap.xy(actmap.height - 1, actmap.width - 1) == (
         new_lr.lon - step / 2,
         new_lr.lat + step / 2,
     )
@@ -60,6 +60,35 @@ def test_map_large_step():
     )
 
 
+def test_map_non_square():
+    check_empty_map(
+        ul=Coordinate(lon=10, lat=20),
+        lr=Coordinate(lon=25, lat=15),
+        new_lr=Coordinate(lon=25, lat=15),
+        step=1,
+        ref_width=15,
+        ref_height=5,
+    )
+
+
+def test_add_basin_non_square_map():
+    actmap = act_map(
+        ul=Coordinate(lon=0, lat=2), lr=Coordinate(lon=6, lat=0), step=1
+    )
+    actmap.measurement_proximity = 0
+    actmap.add_basin(
+        basin=Basin(contour=[[4, 0], [4, 1], [5, 1], [5, 0]]),
+        measurements=[
+            Measurement(activity=SoilActivity(1), coo=Coordinate(4, 0))
+        ],
+    )
+    data = actmap.img.read(1)
+    assert data.shape == (2, 6)
+    assert data[1, 4] > 0
+    assert not data[0, :3].any()
+    assert not data[:, 0:3].any()
+
+
 def test_map_exceeding_step():
     ul = Coordinate(lon=10, lat=20)
     lr = Coordinate(lon=25, lat=5)
@@ -67,6 +96,18 @@ def test_map_exceeding_step():
         act_map(ul, lr, 100)
 
 
+def test_cells_centers():
+    actmap = act_map(
+        ul=Coordinate(lon=10, lat=20), lr=Coordinate(lon=20, lat=10), step=2
+    )
+    xs, ys = actmap.cells_centers()
+    assert xs.shape == (actmap.img.height, actmap.img.width)
+    assert ys.shape == (actmap.img.height, actmap.img.width)
+    for i in range(actmap.img.height):
+        for j in range(actmap.img.width):
+            assert (xs[i, j], ys[i, j]) == actmap.img.xy(i, j)
+
+
 def check_adding_basin(
     basins_with_measurements,
     ref_data_normalized,
@@ -467,3 +508,29 @@ def test_measurments_averaging():
 
     assert data1.shape == data2.shape
     assert (data1 == data2).all()
+
+
+def test_raster_factor_decrease_does_not_overflow():
+    map_size = 6
+    step = 1
+    actmap = act_map(
+        ul=Coordinate(0 - step / 2, map_size - 1 + step / 2),
+        lr=Coordinate(map_size - 1 + step / 2, 0 - step / 2),
+        step=step,
+    )
+    activity = SoilActivity(1)
+    pix_value = activity.surface_1cm * actmap.contamination_depth * step**2
+    actmap.add_basin(
+        Basin(contour=[[1, 1], [1, 4], [4, 4], [4, 1]], shoreline_width=1),
+        [Measurement(activity=activity, coo=Coordinate(1, 1))],
+    )
+    # the first cells of the second basin are only half covered, so they
+    # don't need a smaller raster factor yet, but the following ones do
+    actmap.add_basin(
+        Basin(contour=[[1, 1], [1, 3.5], [4, 3.5], [4, 1]], shoreline_width=1),
+        [Measurement(activity=SoilActivity(3), coo=Coordinate(1, 1))],
+    )
+    data = actmap.img.read(1)
+    assert isclose(
+        data[1, 2] / actmap.raster_factor, 2.5 * pix_value, rel_tol=1e-4
+    )
@@ -193,6 +193,9 @@ class FinderChecker(object):
         )
         assert basin == ref_basin
 
+    def check_no_basin(self, coo):
+        assert self.__finder.get_basin(coo) is None
+
 
 # - - - -
 # - + + -
@@ -294,3 +297,5 @@ def test_multiple_basins():
         ref_basin_contour=[[0.0, 4.0], [0.0, 6.0], [2.0, 6.0]],
         basin_coo=Coordinate(0.5, 5.5, "EPSG:3857"),
     )
+    checker.check_no_basin(Coordinate(3.0, 3.0, "EPSG:3857"))
+    checker.check_no_basin(Coordinate(10.0, 10.0, "EPSG:3857"))
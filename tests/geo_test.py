@@ -1,5 +1,6 @@
 from codiri.src.geo import (
     distance,
+    distances,
     Coordinate,
     Map,
 )
@@ -35,6 +36,20 @@ def test_distance():
     ) == pytest.approx(500, 0.1)
 
 
+def test_distances():
+    crs = "EPSG:3857"
+    point = Coordinate(1000, 1000, crs)
+    lons = np.array([[1500, 1000], [3000, 7000]])
+    lats = np.array([[1000, 1500], [-2000, 4000]])
+    dists = distances(point, lons, lats, crs)
+    assert dists.shape == lons.shape
+    for i in range(lons.shape[0]):
+        for j in range(lons.shape[1]):
+            assert dists[i, j] == pytest.approx(
+                distance(point, Coordinate(lons[i, j], lats[i, j], crs))
+            )
+
+
 class TestMap(object):
     def test_real_map(self):
         directory = os.path.abspath(os.path.dirname(__file__))
@@ -125,3 +125,21 @@ class TestInput(unittest.TestCase):
         inp.add_specific_activity("Cs-137", 1)
         self.assertEqual(inp.nuclides, ("Cs-137",))
         self.assertTrue(inp.initialized())
+
+    def test_input_clone(self):
+        inp = Input()
+        inp.distance = 1
+        inp.terrain_type = "forest"
+        inp.add_specific_activity("Cs-137", 1)
+        clone = inp.clone()
+        self.assertEqual(str(clone), str(inp))
+        clone.distance = 2
+        clone.add_specific_activity("Cs-137", 2)
+        clone.add_specific_activity("Sr-90", 3)
+        self.assertEqual(inp.distance, 1)
+        self.assertEqual(inp.nuclides, ("Cs-137",))
+        self.assertEqual(inp.specific_activities["Cs-137"], 1)
+        self.assertEqual(clone.terrain_type, "forest")
+        self.assertEqual(clone.nuclides, ("Cs-137", "Sr-90"))
+        with self.assertRaises(ValueError):
+            clone.distance = -1
@@ -1,8 +1,10 @@
-from codiri.src.model.model import Model
+from codiri.src.model.model import Model, per_class_results
 from codiri.src.model.constraints import ConstraintsComplianceError
 from codiri.src.model.reference import IReference
 from codiri.src.model.input import Input
 from unittest.mock import MagicMock
+import numpy as np
+import math
 import unittest
 
 
@@ -12,7 +14,7 @@ class FakeReference(IReference):
 
 
 class FakeInput(Input):
-    def __init__(self):
+    def __init__(self, specific_activity=1):
         super(FakeInput, self).__init__()
         self.distance = 1
         self.square_side = 1
@@ -37,7 +39,8 @@ class FakeInput(Input):
             "cabbage": 5,
             "potato": 6,
         }
-        self.add_specific_activity("Cs-137", 1)
+        if specific_activity is not None:
+            self.add_specific_activity("Cs-137", specific_activity)
 
 
 class ModelTest(Model):
@@ -84,3 +87,148 @@ class TestModelValidateInput(unittest.TestCase):
     def test_positive(self):
         self.model.constraints.validate = MagicMock(return_value=None)
         self.assertTrue(self.model.validate_input(FakeInput()))
+
+
+class DataReference(IReference):
+    def _initialize_data(self):
+        self._dose_rate_decay_coeff = 1.27e-9
+        self._residence_time = 3.15e7
+        self._unitless_washing_capacity = 5.0
+        self._terrain_clearance = 1.0
+        self._mixing_layer_height = 100.0
+        self._age_groups = {
+            1: {
+                "lower_age": 0,
+                "upper_age": 18,
+                "respiration_rate": 2e-4,
+                "daily_metabolic_cost": 2000,
+            },
+            2: {
+                "lower_age": 18,
+                "upper_age": 200,
+                "respiration_rate": 2.6e-4,
+                "daily_metabolic_cost": 2800,
+            },
+        }
+        self._diffusion_coefficients = {
+            aclass: {"p_z": 0.1, "q_z": 0.8, "p_y": 0.2, "q_y": 0.9}
+            for aclass in ("A", "B", "C", "D", "E", "F")
+        }
+        self._nuclides = {
+            "Cs-137": {
+                "decay_coeff": 7.3e-10,
+                "group": "aerosol",
+                "R_cloud": 2.6e-14,
+                "R_inh": 4.6e-9,
+                "R_surface": 5.4e-16,
+                "R_food": 1.3e-8,
+                "deposition_rate": 0.008,
+                "standard_washing_capacity": 1e-5,
+                "food_critical_age_group": 2,
+            }
+        }
+        self._roughness = {"greenland": {"roughness": 0.1}}
+        self._food = {
+            food_id: {"category": category}
+            for food_id, category in enumerate(
+                ("meat", "milk", "wheat", "cucumbers", "cabbage", "potato")
+            )
+        }
+        self._atmosphere_accum_factors = {
+            "Cs-137": {food_id: 0.01 for food_id in self._food}
+        }
+        self._soil_accum_factors = {
+            "Cs-137": {food_id: 0.001 for food_id in self._food}
+        }
+
+
+class TestModelCalculateBatch(unittest.TestCase):
+    def setUp(self):
+        # batch input has no specific activities
+        self.template = FakeInput(specific_activity=None)
+        self.template.square_side = 100
+        self.template.blowout_time = 3600
+
+    def test_equals_calculate(self):
+        distances = np.array([1000.0, 60000.0, 3000.0])
+        activities = np.array([2.0, 3.0, 5.0])
+
+        inp = self.template.clone()
+        for k in range(len(distances)):
+            e_max, values = Model(DataReference()).calculate_batch_sum(
+                self.template,
+                "Cs-137",
+                distances[k : k + 1],
+                activities[k : k + 1],
+            )
+            inp.distance = distances[k]
+            inp.add_specific_activity("Cs-137", activities[k])
+            model = Model(DataReference())
+            if not model.calculate(inp):
+                self.assertFalse(e_max.any())
+                self.assertFalse(values.any())
+                continue
+            results = model.results
+            self.assertAlmostEqual(e_max[0] / results.e_max_10_acute, 1)
+            self.assertAlmostEqual(e_max[1] / results.e_max_10_period, 1)
+            for name in ("e_total_10_period", "depositions", "e_food"):
+                n = per_class_results.index(name)
+                for c, aclass in enumerate(("A", "B", "C", "D", "E", "F")):
+                    expected = getattr(results, name)["Cs-137"][aclass]
+                    self.assertAlmostEqual(values[n, c] / expected, 1)
+            self.assertEqual(
+                list(values[per_class_results.index("full_depletions")]),
+                list(results.full_depletions["Cs-137"].values()),
+            )
+
+    def test_sum_equals_sources_sum(self):
+        distances = np.array([1000.0, 60000.0, 3000.0])
+        activities = np.array([2.0, 3.0, 5.0])
+        e_max, values = Model(DataReference()).calculate_batch_sum(
+            self.template, "Cs-137", distances, activities
+        )
+
+        expected_e_max = np.zeros_like(e_max)
+        expected_values = np.zeros_like(values)
+        for k in range(len(distances)):
+            source_e_max, source_values = Model(
+                DataReference()
+            ).calculate_batch_sum(
+                self.template,
+                "Cs-137",
+                distances[k : k + 1],
+                activities[k : k + 1],
+            )
+            expected_e_max += source_e_max
+            expected_values += source_values
+
+        np.testing.assert_allclose(e_max, expected_e_max)
+        np.testing.assert_allclose(values, expected_values)
+
+    def test_table_at_nodes(self):
+        nodes = np.array([1000.0, 2000.0, 4000.0])
+        distances = np.array([4000.0, 1000.0, 1000.0])
+        activities = np.array([2.0, 3.0, 5.0])
+        table = Model(DataReference()).tabulate(self.template, "Cs-137", nodes)
+        e_max, values = table.calculate_batch_sum(distances, activities)
+        expected_e_max, expected_values = Model(
+            DataReference()
+        ).calculate_batch_sum(self.template, "Cs-137", distances, activities)
+
+        np.testing.assert_allclose(e_max, expected_e_max)
+        np.testing.assert_allclose(values, expected_values)
+
+        # interpolation is linear in logarithm of distance
+        e_max, _ = table.calculate_batch_sum(
+            np.array([math.sqrt(1000.0 * 2000.0)]), np.array([2.0])
+        )
+        np.testing.assert_allclose(
+            e_max, table.calculate_batch_sum(nodes[:2], np.ones(2))[0]
+        )
+        # and is clamped outside the nodes
+        e_max, _ = table.calculate_batch_sum(
+            np.array([10.0, 8000.0]), np.ones(2)
+        )
+        np.testing.assert_allclose(
+            e_max, table.calculate_batch_sum(nodes[::2], np.ones(2))[0]
+        )